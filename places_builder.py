@@ -7,6 +7,12 @@ Builds the master 'places_database.csv' by:
 3. Fetching granular Popular Times data.
 4. Imputing missing crowd data using spatial nearest neighbors.
 
+Intermediate steps are persisted to 'places_database.feather' (zstd), with
+attributes/popular_times kept as native lists; the CSV (with those columns
+JSON-encoded) is only written at the end, for the website. If the Feather
+file already exists the build resumes from it, skipping places already
+matched/scraped.
+
 Output Columns: name, longitude, latitude, google_id, attributes, popular_times
 """
 
@@ -14,62 +20,148 @@ import requests
 import pandas as pd
 import googlemaps
 import populartimes
-import json
-import sys
+import orjson
+import os
 import time
 import math
+import shelve
+import functools
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError: # Step 4 falls back to impute_kernel()
+    BallTree = None
+
+try:
+    from numba import njit, prange
+except ImportError: # impute_kernel() then runs as plain (slow) Python
+    prange = range
+    def njit(*args, **kwargs):
+        return lambda fn: fn
 
 # --------------------------------------------------------
 # CONFIGURATION
 # --------------------------------------------------------
 GOOGLE_API_KEY = ""  
 OUTPUT_FILE = "places_database.csv"
+STORAGE = "places_database.feather"
 NEIGHBORS_TO_IMPUTE = 3 # For Step 4
+EARTH_RADIUS_M = 6371e3
+# Averages truncate to int; the epsilon stops float noise (49.99999...) from costing a whole unit
+TRUNCATE_EPS = 1e-6
+GOOGLE_WORKERS = 16 # Concurrent Google API requests (Step 2)
+POPULARTIMES_WORKERS = 8 # Concurrent scrapes (Step 3), kept low to respect rate limits
+API_MAX_RETRIES = 5
+# Statuses googlemaps.Client does not retry itself (see is_transient_api_error)
+TRANSIENT_API_STATUSES = ('UNKNOWN_ERROR',)
+CHECKPOINT_EVERY = 100 # Step 3 saves partial progress every N places
+CACHE_FILE = "gmaps_cache.db" # Persistent Google API response cache
+CACHE_MAX_AGE_DAYS = 30
 
 # --------------------------------------------------------
 # UTILS
 # --------------------------------------------------------
-def print_progress(iteration, total, prefix='', suffix='', decimals=1, length=50, fill='█'):
+def is_transient_api_error(err):
+    """True for Google API failures worth retrying; permanent statuses (bad key, quota...) fail fast"""
+    # googlemaps.Client already retries OVER_QUERY_LIMIT and HTTP 5xx with its own
+    # backoff, raising Timeout once its retry_timeout (60s) runs out, so neither is
+    # retried again here. This layer only covers what the client gives up on at once:
+    # connection failures (TransportError) and UNKNOWN_ERROR responses.
+    if isinstance(err, googlemaps.exceptions.ApiError):
+        return err.status in TRANSIENT_API_STATUSES
+    return isinstance(err, googlemaps.exceptions.TransportError)
+
+def with_backoff(call, *args, retry_if=is_transient_api_error, **kwargs):
+    """Calls an API method, retrying with exponential backoff (max 30s) while retry_if(error)"""
+    for attempt in range(API_MAX_RETRIES):
+        try:
+            return call(*args, **kwargs)
+        except Exception as err:
+            if attempt == API_MAX_RETRIES - 1 or not retry_if(err):
+                raise
+            time.sleep(min(2 ** attempt, 30))
+
+def cached_api_call(cache, cache_lock, key, call, *args, **kwargs):
+    """Returns the cached response for key, calling the API only on a miss or stale entry"""
+    with cache_lock:
+        entry = cache.get(key)
+    if entry is not None and time.time() - entry['fetched_at'] < CACHE_MAX_AGE_DAYS * 86400:
+        return orjson.loads(entry['response'])
+
+    response = with_backoff(call, *args, **kwargs)
+    with cache_lock:
+        cache[key] = {'fetched_at': time.time(), 'response': orjson.dumps(response)}
+    return response
+
+@njit(parallel=True, fastmath=True)
+def impute_kernel(tgt_lat, tgt_lon, src_lat, src_lon, src_cos, src_sched, k):
     """
-    Call in a loop to create terminal progress bar
+    Fallback for Step 4 when scikit-learn is not installed: haversine distance
+    to every source, top-K neighbours + IDW average per target. Coordinates in
+    radians; src_cos is cos(src_lat), precomputed once by the caller.
+    Returns a (T, 7, 24) int8 array.
     """
-    if total == 0:
-        return
-    percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
-    filled_length = int(length * iteration // total)
-    bar = fill * filled_length + '-' * (length - filled_length)
-    sys.stdout.write(f'\r{prefix} |{bar}| {percent}% {suffix}')
-    if iteration == total: 
-        sys.stdout.write('\n')
-    sys.stdout.flush()
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate distance (in meters) between two points"""
-    R = 6371e3 
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def parse_schedule(json_str):
+    n_tgt = tgt_lat.shape[0]
+    out = np.zeros((n_tgt, 7, 24), dtype=np.int8)
+    for t in prange(n_tgt):
+        cos_t = math.cos(tgt_lat[t])
+        a = np.sin((src_lat - tgt_lat[t]) / 2)**2 + cos_t * src_cos * np.sin((src_lon - tgt_lon[t]) / 2)**2
+        dists = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+        # Top K via quickselect; their order doesn't matter for the average.
+        # Ties at the K-th distance (places sharing coordinates) go to the
+        # lowest source index, as a stable sort would pick them.
+        kth = np.partition(dists, k - 1)[k - 1]
+        nearest = np.empty(k, dtype=np.int64)
+        n = 0
+        for s in range(dists.shape[0]):
+            if dists[s] < kth:
+                nearest[n] = s
+                n += 1
+        for s in range(dists.shape[0]):
+            if n == k: break
+            if dists[s] == kth:
+                nearest[n] = s
+                n += 1
+
+        # float64 accumulation; TRUNCATE_EPS absorbs summation-order noise before truncation
+        weighted_sum = np.zeros((7, 24))
+        total_weight = 0.0
+        for s in nearest:
+            weight = 1.0 / max(dists[s], 50.0)**2 # Inverse Distance Weighting (Squared)
+            weighted_sum += src_sched[s] * weight
+            total_weight += weight
+        out[t] = np.floor(weighted_sum / total_weight + TRUNCATE_EPS).astype(np.int8)
+    return out
+
+DAY_IDX = {"Monday": 0, "Tuesday": 1, "Wednesday": 2, "Thursday": 3, "Friday": 4, "Saturday": 5, "Sunday": 6}
+
+def parse_schedule(data):
     """Returns a numpy array (7 days x 24 hours) or None if empty"""
     try:
-        data = json.loads(json_str)
-        if not data or len(data) < 7: return None
-        matrix = []
-        days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        sorted_data = sorted(data, key=lambda x: days_order.index(x['name']) if x['name'] in days_order else 0)
-        for day in sorted_data:
-            matrix.append(day['data'])
-        return np.array(matrix)
-    except:
+        if len(data) < 7: return None
+        # Busyness is 0-100, so int8 is plenty
+        matrix = np.empty((7, 24), dtype=np.int8)
+        seen = 0
+        for day in data:
+            i = DAY_IDX.get(day['name'])
+            if i is None: continue
+            hours = np.asarray(day['data'])
+            # Out-of-range values make the schedule unusable; checked here because
+            # Feather hands back int64 arrays, which would wrap silently in int8
+            if hours.min() < 0 or hours.max() > 100: return None
+            matrix[i] = hours
+            seen |= 1 << i
+        # Only complete weeks are usable (every row of matrix written)
+        return matrix if seen == 0x7F else None
+    except (KeyError, TypeError, ValueError):
         return None
 
-def format_schedule_back_to_json(numpy_matrix):
-    """Converts numpy array back to JSON string"""
+def format_schedule(numpy_matrix):
+    """Converts numpy array back to the populartimes list format"""
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     output = []
     for i, day_name in enumerate(days):
@@ -77,7 +169,21 @@ def format_schedule_back_to_json(numpy_matrix):
             "name": day_name,
             "data": numpy_matrix[i].tolist()
         })
-    return json.dumps(output)
+    return output
+
+def to_json(value):
+    """JSON string for a list column value (Feather reads lists back as numpy arrays)"""
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        raise TypeError
+    return orjson.dumps(value, default=default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def export_to_csv(df):
+    """Writes the final CSV consumed by the website"""
+    df = df.assign(attributes=df['attributes'].map(to_json), popular_times=df['popular_times'].map(to_json))
+    # IMPORTANT: Quote non-numeric fields to handle JSON strings properly
+    df.to_csv(OUTPUT_FILE, index=False, quoting=1)
 
 def main():
     print(f"\n--- 🚀 STARTING BUILDER FOR {OUTPUT_FILE} ---")
@@ -87,29 +193,33 @@ def main():
     # --------------------------------------------------------
     print("\n[Step 1/4] Fetching Base POIs from OpenData BCN...")
     
-    try:
-        url = "https://opendata-ajuntament.barcelona.cat/data/api/action/datastore_search?resource_id=31431b23-d5b9-42b8-bcd0-a84da9d8c7fa&limit=32000"
-        response = requests.get(url)
-        response.raise_for_status() 
-        data = response.json()["result"]["records"]
-        raw_df = pd.DataFrame(data)
-
-        df = pd.DataFrame()
-        df['name'] = raw_df['name'] 
-        df['latitude'] = pd.to_numeric(raw_df['geo_epgs_4326_lat'], errors='coerce')
-        df['longitude'] = pd.to_numeric(raw_df['geo_epgs_4326_lon'], errors='coerce')
-        df = df.dropna(subset=['latitude', 'longitude'])
+    if os.path.exists(STORAGE):
+        # Keeps earlier Google IDs / Popular Times so Steps 2-3 can skip those places
+        print(f"⏩ Resuming from existing {STORAGE} (delete it to rebuild from scratch).")
+    else:
+        try:
+            url = "https://opendata-ajuntament.barcelona.cat/data/api/action/datastore_search?resource_id=31431b23-d5b9-42b8-bcd0-a84da9d8c7fa&limit=32000"
+            response = requests.get(url)
+            response.raise_for_status() 
+            data = response.json()["result"]["records"]
+            raw_df = pd.DataFrame(data)
+
+            df = pd.DataFrame()
+            df['name'] = raw_df['name'] 
+            df['latitude'] = pd.to_numeric(raw_df['geo_epgs_4326_lat'], errors='coerce')
+            df['longitude'] = pd.to_numeric(raw_df['geo_epgs_4326_lon'], errors='coerce')
+            df = df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
         
-        df['google_id'] = ""
-        df['attributes'] = ""
-        df['popular_times'] = ""
+            df['google_id'] = ""
+            df['attributes'] = [[] for _ in range(len(df))]
+            df['popular_times'] = [[] for _ in range(len(df))]
 
-        df.to_csv(OUTPUT_FILE, index=False)
-        print(f"✅ Step 1 Complete. Base database saved with {len(df)} locations.")
+            df.to_feather(STORAGE, compression='zstd')
+            print(f"✅ Step 1 Complete. Base database saved with {len(df)} locations.")
 
-    except Exception as e:
-        print(f"❌ Error in Step 1: {e}")
-        return
+        except Exception as e:
+            print(f"❌ Error in Step 1: {e}")
+            return
 
     # --------------------------------------------------------
     # STEP 2: GOOGLE ENRICHMENT (ID, Name, Attributes)
@@ -117,80 +227,122 @@ def main():
     print("\n[Step 2/4] Enriching with Google Maps (ID, Name, Attributes)...")
     
     gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
-    df = pd.read_csv(OUTPUT_FILE)
-    
-    df['google_id'] = df['google_id'].astype('object')
-    df['attributes'] = df['attributes'].astype('object')
-    df['name'] = df['name'].astype('object')
+    df = pd.read_feather(STORAGE)
     
-    valid_rows = []
+    # shelve is not thread-safe, so every access goes through cache_lock
+    cache = shelve.open(CACHE_FILE)
+    cache_lock = threading.Lock()
+
+    @functools.lru_cache(maxsize=None)
+    def find_place(search_query):
+        return cached_api_call(cache, cache_lock, f"find_place:{search_query}",
+                               gmaps.find_place, input=search_query, input_type="textquery")
+
+    @functools.lru_cache(maxsize=None)
+    def place_details(place_id):
+        return cached_api_call(cache, cache_lock, f"place:{place_id}",
+                               gmaps.place, place_id=place_id, fields=['name', 'type'])
+
     total_rows = len(df)
-    error_printed = False 
+    error_lock = threading.Lock()
+    error_state = {'printed': False}
+
+    def report_error(message):
+        with error_lock:
+            if not error_state['printed']:
+                tqdm.write(message)
+                error_state['printed'] = True
 
-    for index, row in df.iterrows():
+    def enrich(row):
+        """Returns the row, enriched with Google data if a place matched (google_id stays "" otherwise)"""
         original_name = str(row['name']).strip()
         search_query = original_name if "Barcelona" in original_name else f"{original_name}, Barcelona"
         
+        if isinstance(row.get('google_id'), str) and row['google_id'] and len(row['attributes']) > 0:
+            # Fully enriched on a previous run, no API call needed
+            return row
+
         try:
-            find_res = gmaps.find_place(input=search_query, input_type="textquery")
-            
+            find_res = find_place(search_query)
+
             if find_res['status'] == 'OK' and len(find_res['candidates']) > 0:
                 place_id = find_res['candidates'][0]['place_id']
                 row['google_id'] = place_id
-                
+
                 try:
-                    details_res = gmaps.place(place_id=place_id, fields=['name', 'type'])
+                    details_res = place_details(place_id)
                     if details_res['status'] == 'OK':
                         result = details_res['result']
                         row['name'] = result.get('name', original_name) 
-                        row['attributes'] = json.dumps(result.get('types', [])) 
+                        row['attributes'] = result.get('types', [])
                 except Exception as detail_err:
-                    row['attributes'] = "[]"
-                    if not error_printed:
-                        print(f"\n⚠️ Warning on details fetch: {detail_err}")
-                        error_printed = True
-
-                valid_rows.append(row)
-            else:
-                pass 
+                    row['attributes'] = []
+                    report_error(f"\n⚠️ Warning on details fetch: {detail_err}")
 
         except Exception as e:
-            if not error_printed:
-                print(f"\n❌ CRITICAL API ERROR: {e}")
-                error_printed = True
-    
-        print_progress(index + 1, total_rows, prefix='Progress:', suffix=f'Found: {len(valid_rows)}', length=40)
+            report_error(f"\n❌ CRITICAL API ERROR: {e}")
+        return row
+
+    try:
+        with ThreadPoolExecutor(max_workers=GOOGLE_WORKERS) as ex:
+            results = list(tqdm(ex.map(enrich, df.to_dict('records')), total=total_rows, desc='Progress'))
+    finally:
+        # Always flush the cache index, even on Ctrl-C or an unexpected error
+        cache.close()
 
-    df_enriched = pd.DataFrame(valid_rows)
-    df_enriched.to_csv(OUTPUT_FILE, index=False)
-    print(f"\n✅ Step 2 Complete. {len(valid_rows)} places matched & saved. ({total_rows - len(valid_rows)} dropped)")
+    # Unmatched places stay in the store (empty google_id) so a later run retries them;
+    # they are only dropped from the final CSV in Step 4
+    df_enriched = pd.DataFrame.from_records(results, columns=df.columns)
+    df_enriched.to_feather(STORAGE, compression='zstd')
+    matched = int((df_enriched['google_id'] != "").sum())
+    print(f"\n✅ Step 2 Complete. {matched} places matched & saved. ({total_rows - matched} unmatched, kept for retry)")
 
     # --------------------------------------------------------
     # STEP 3: POPULAR TIMES FETCH
     # --------------------------------------------------------
     print("\n[Step 3/4] Fetching Popular Times (Scraping)...")
     
-    df = pd.read_csv(OUTPUT_FILE)
-    df['popular_times'] = df['popular_times'].astype('object')
+    df = pd.read_feather(STORAGE)
     total_rows = len(df)
-    success_count = 0
-    
-    for index, row in df.iterrows():
-        place_id = str(row['google_id'])
+    google_ids = df['google_id'].astype(str).tolist()
+    popular_times = df['popular_times'].tolist()
+    # Only matched places are scraped, skipping those done on a previous run
+    pending = [index for index, pt in enumerate(popular_times) if google_ids[index] and len(pt) == 0]
+    success_count = sum(len(pt) > 0 for pt in popular_times)
+
+    def fetch(index, place_id):
+        """Returns (index, popular_times, ok) for one place"""
         try:
-            data = populartimes.get_id(GOOGLE_API_KEY, place_id)
+            # Network errors (urllib and requests alike) are OSError subclasses
+            data = with_backoff(populartimes.get_id, GOOGLE_API_KEY, place_id,
+                                retry_if=lambda err: isinstance(err, OSError))
             if 'populartimes' in data:
-                row['popular_times'] = json.dumps(data['populartimes'])
-                success_count += 1
-            else:
-                row['popular_times'] = "[]"
+                return index, data['populartimes'], True
         except Exception:
-            row['popular_times'] = "[]"
-
-        df.iloc[index] = row
-        print_progress(index + 1, total_rows, prefix='Progress:', suffix=f'Got Data: {success_count}', length=40)
+            pass
+        return index, [], False
+    
+    with ThreadPoolExecutor(max_workers=POPULARTIMES_WORKERS) as ex:
+        futures = [ex.submit(fetch, index, google_ids[index]) for index in pending]
+        try:
+            bar = tqdm(as_completed(futures), total=len(pending), desc='Progress')
+            for done, future in enumerate(bar, 1):
+                index, place_times, ok = future.result()
+                popular_times[index] = place_times
+                success_count += ok
 
-    df.to_csv(OUTPUT_FILE, index=False)
+                bar.set_postfix_str(f'Got Data: {success_count}', refresh=False)
+                if done % CHECKPOINT_EVERY == 0:
+                    # Persist partial progress so a crash doesn't lose finished places
+                    df['popular_times'] = popular_times
+                    df.to_feather(STORAGE, compression='zstd')
+        finally:
+            # On Ctrl-C or an error, drop the queued scrapes instead of running (and
+            # paying for) them all in the executor's exit, then save what finished.
+            # Single column assignment instead of a per-row df.iloc setitem.
+            ex.shutdown(cancel_futures=True)
+            df['popular_times'] = popular_times
+            df.to_feather(STORAGE, compression='zstd')
     print(f"\n✅ Step 3 Complete. Popular times gathered for {success_count} places.")
 
     # --------------------------------------------------------
@@ -198,64 +350,61 @@ def main():
     # --------------------------------------------------------
     print("\n[Step 4/4] Imputing Missing Crowd Data (Spatial Neighbors)...")
     
-    df = pd.read_csv(OUTPUT_FILE)
+    df = pd.read_feather(STORAGE)
+    # Places Google never matched are left out of the website export
+    df = df[df['google_id'] != ""].reset_index(drop=True)
+
+    # Work on plain numpy columns; the DataFrame is only rebuilt at save time
+    lat_rad = np.radians(df['latitude'].to_numpy())
+    lon_rad = np.radians(df['longitude'].to_numpy())
+    pt = df['popular_times'].to_numpy(dtype=object, copy=True)
     
     # Identify Sources/Targets
-    df['has_data'] = df['popular_times'].apply(lambda x: len(str(x)) > 20 if pd.notna(x) else False)
-    sources = df[df['has_data']].copy()
-    targets = df[~df['has_data']].copy()
+    has_data = df['popular_times'].str.len().to_numpy() > 0
+    tgt_pos = np.flatnonzero(~has_data)
     
-    if len(sources) == 0:
+    # Pre-parse sources, keeping only those with a usable schedule
+    source_schedules = df['popular_times'][has_data].map(parse_schedule).dropna()
+
+    if len(source_schedules) == 0:
         print("❌ Error: No source data found to spread! Step 3 failed.")
         return
 
-    # Pre-parse sources
-    source_schedules = {}
-    for idx, row in sources.iterrows():
-        sched = parse_schedule(row['popular_times'])
-        if sched is not None:
-            source_schedules[idx] = sched
+    # (S, 7, 24) matrix, row-aligned with src_pos (and the BallTree below).
+    # df has a default RangeIndex (reset above), so index labels are positions.
+    src_pos = source_schedules.index.to_numpy()
+    src_mat = np.stack(source_schedules.to_list())
 
-    imputed_count = 0
-    total_targets = len(targets)
-    
-    for idx, target in targets.iterrows():
-        t_lat, t_lon = target['latitude'], target['longitude']
-        distances = []
-        
-        # Distance to all sources
-        for s_idx, source in sources.iterrows():
-            dist = haversine(t_lat, t_lon, source['latitude'], source['longitude'])
-            distances.append((s_idx, dist))
-        
-        # Top K Neighbors
-        distances.sort(key=lambda x: x[1])
-        nearest_k = distances[:NEIGHBORS_TO_IMPUTE]
-        
-        # Weighted Average
-        weighted_sum = np.zeros((7, 24))
-        total_weight = 0
-        
-        for s_idx, dist in nearest_k:
-            weight = 1 / (max(dist, 50) ** 2) # Inverse Distance Weighting (Squared)
-            sched = source_schedules.get(s_idx)
-            if sched is not None:
-                weighted_sum += (sched * weight)
-                total_weight += weight
-                
-        if total_weight > 0:
-            final_matrix = (weighted_sum / total_weight).astype(int)
-            final_json = format_schedule_back_to_json(final_matrix)
-            df.at[idx, 'popular_times'] = final_json
-            imputed_count += 1
-            
-        print_progress(imputed_count, total_targets, prefix='Imputing:', length=40)
-
-    # Cleanup and Save
-    df.drop(columns=['has_data'], inplace=True)
-    
-    # IMPORTANT: Quote non-numeric fields to handle JSON strings properly
-    df.to_csv(OUTPUT_FILE, index=False, quoting=1) 
+    k = min(NEIGHBORS_TO_IMPUTE, len(src_pos))
+    src_lat, src_lon = lat_rad[src_pos], lon_rad[src_pos]
+    tgt_lat, tgt_lon = lat_rad[tgt_pos], lon_rad[tgt_pos]
+
+    if BallTree is not None:
+        # Top K Neighbors for every target in a single BallTree query (haversine, in radians)
+        tree = BallTree(np.column_stack([src_lat, src_lon]), metric='haversine')
+        if len(tgt_pos) > 0:
+            # Neighbour order is irrelevant to the weighted average, so skip sorting it
+            dists, idxs = tree.query(np.column_stack([tgt_lat, tgt_lon]), k=k, sort_results=False)
+        else:
+            dists, idxs = np.empty((0, k)), np.empty((0, k), dtype=int)
+        dists *= EARTH_RADIUS_M
+
+        # Inverse Distance Weighting (Squared), for all targets at once
+        # Sources stay int8; float64 average, TRUNCATE_EPS absorbs summation-order noise before truncation
+        w = 1.0 / np.maximum(dists, 50) ** 2 # (T, K)
+        final = (w[:, :, None, None] * src_mat[idxs]).sum(1) / w.sum(1)[:, None, None]
+        final_matrices = np.floor(final + TRUNCATE_EPS).astype(np.int8)
+    else:
+        final_matrices = impute_kernel(tgt_lat, tgt_lon, src_lat, src_lon, np.cos(src_lat), src_mat, k)
+
+    # Element-wise, so numpy doesn't try to broadcast the nested lists
+    for p, m in zip(tgt_pos, final_matrices):
+        pt[p] = format_schedule(m)
+    imputed_count = len(tgt_pos)
+
+    # Save
+    df['popular_times'] = pt
+    export_to_csv(df)
     
     print(f"\n✅ Step 4 Complete. Filled {imputed_count} missing locations.")
     print(f"\n🎉 DATABASE BUILD COMPLETE. Saved to {OUTPUT_FILE}")